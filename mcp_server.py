@@ -1,17 +1,62 @@
 # mcp_server.py (Flask MCP JSON-RPC wrapper for grok_search.py)
-import json
+import copy
+import hashlib
+import logging
 import os
 import subprocess
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
+from typing import Annotated, Any, Literal
 
-from flask import Flask, jsonify, request
-
-app = Flask(__name__)
+import msgspec
+import orjson
+from cachetools import TTLCache
+from flask import Flask, Response, jsonify, request
+from flask_orjson import OrjsonProvider
 
 ROOT_DIR = Path(__file__).resolve().parent
 GROK_SCRIPT_PATH = ROOT_DIR / "scripts" / "grok_search.py"
 
+sys.path.insert(0, str(GROK_SCRIPT_PATH.parent))
+import grok_search  # noqa: E402
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+if not logger.isEnabledFor(logging.DEBUG):
+    # httpx logs every upstream request at INFO; keep that off the hot path too
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Set GROK_MCP_SUBPROCESS=1 to run every query in a fresh interpreter (isolation over speed)
+USE_SUBPROCESS = os.getenv("GROK_MCP_SUBPROCESS") == "1"
+DEFAULT_ARGS = grok_search.default_args()
+SEARCH_TIMEOUT_SECONDS = 120
+
+# Batch items fan out here; sized to the HTTP pool so every worker can hold a connection
+BATCH_POOL = ThreadPoolExecutor(
+    max_workers=grok_search.HTTP_POOL_MAXSIZE, thread_name_prefix="rpc-batch"
+)
+
+# Successful results are reused for GROK_CACHE_TTL seconds; GROK_CACHE_TTL=0 or
+# GROK_CACHE_SIZE=0 disables caching
+CACHE_TTL_SECONDS = float(os.getenv("GROK_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("GROK_CACHE_SIZE", "512"))
+RESULT_CACHE = (
+    TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+    if CACHE_TTL_SECONDS > 0 and CACHE_MAX_ENTRIES > 0
+    else None
+)
+RESULT_CACHE_LOCK = threading.Lock()
+
+# Single-flight: concurrent identical queries wait on the first caller's Future
+INFLIGHT: dict = {}
+INFLIGHT_LOCK = threading.Lock()
+
 SERVER_INFO = {"name": "grok-search-mcp", "version": "0.1.0"}
 
 TOOL_NAME = "grok_search"
@@ -30,16 +75,148 @@ TOOL_DEF = {
     },
 }
 
+# Wire schemas: msgspec validates these in C in the same pass that decodes the body
+class RpcMessage(msgspec.Struct):
+    jsonrpc: Literal["2.0"]
+    method: Annotated[str, msgspec.Meta(min_length=1)]
+    # Bounded to int64 (msgspec's widest constraint range), which orjson can always encode
+    id: Annotated[int, msgspec.Meta(ge=-(2**63), le=2**63 - 1)] | float | str | None = None
+    params: dict[str, Any] | None = None
+
+class ToolsCallParams(msgspec.Struct):
+    name: str | None = None
+    arguments: dict[str, Any] | str | None = None
+
+class ToolArguments(msgspec.Struct):
+    query: str = ""
+
+RpcPayload = RpcMessage | list[Any]
+
+DEFAULT_PROTOCOL_VERSION = "2024-11-05"
+
+# Static results are encoded once; only the request id (and protocolVersion) vary per call
+TOOLS_LIST_RESULT_JSON = orjson.dumps({"tools": [TOOL_DEF]})
+INITIALIZE_RESULT_TAIL_JSON = b"," + orjson.dumps(
+    {
+        "serverInfo": SERVER_INFO,
+        "capabilities": {
+            "tools": {},   # declare tools capability
+        },
+    }
+)[1:]
+
 def jsonrpc_result(_id, result):
     return jsonify({"jsonrpc": "2.0", "id": _id, "result": result})
 
+def jsonrpc_encoded_result(_id, result_json: bytes):
+    try:
+        id_json = orjson.dumps(_id)
+    except TypeError:
+        return jsonrpc_error(None, -32600, "Invalid Request")
+    body = b'{"jsonrpc":"2.0","id":' + id_json + b',"result":' + result_json + b"}"
+    return Response(body, mimetype="application/json")
+
 def jsonrpc_error(_id, code, message, data=None):
     err = {"code": code, "message": message}
     if data is not None:
         err["data"] = data
-    return jsonify({"jsonrpc": "2.0", "id": _id, "error": err})
+    try:
+        return jsonify({"jsonrpc": "2.0", "id": _id, "error": err})
+    except TypeError:
+        # orjson rejects some values stdlib json accepted (e.g. integers beyond 64 bits):
+        # drop the echoed data first, then the id
+        err.pop("data", None)
+        try:
+            return jsonify({"jsonrpc": "2.0", "id": _id, "error": err})
+        except TypeError:
+            return jsonify({"jsonrpc": "2.0", "id": None, "error": err})
+
+def result_cache_key(query: str, settings: dict) -> bytes:
+    # Everything that shapes the answer: model, prompt, upstream and extra body fields
+    fingerprint = b"|".join(
+        (
+            settings["model"].encode(),
+            settings["system_prompt"].encode(),
+            settings["base_url"].encode(),
+            b"raw" if settings["include_raw"] else b"",
+            orjson.dumps(settings["extra_body"], option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS),
+            " ".join(query.split()).encode(),
+        )
+    )
+    return hashlib.blake2b(fingerprint, digest_size=16).digest()
+
+def cache_lookup(key: bytes):
+    if RESULT_CACHE is None:
+        return None
+    with RESULT_CACHE_LOCK:
+        return RESULT_CACHE.get(key)
 
 def run_grok_search(query: str) -> dict:
+    try:
+        settings = grok_search.get_settings(DEFAULT_ARGS)
+    except grok_search.GrokSearchCliError as exc:
+        return exc.payload
+    except Exception as exc:
+        return {"ok": False, "error": "unexpected_exception", "detail": str(exc)}
+
+    key = result_cache_key(query, settings)
+    cached = cache_lookup(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    with INFLIGHT_LOCK:
+        future = INFLIGHT.get(key)
+        is_leader = future is None
+        if is_leader:
+            # A leader may have cached its result and left INFLIGHT since the first lookup
+            cached = cache_lookup(key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+            future = INFLIGHT[key] = Future()
+
+    if not is_leader:
+        try:
+            return copy.deepcopy(future.result(timeout=SEARCH_TIMEOUT_SECONDS))
+        except FutureTimeoutError:
+            return {
+                "ok": False,
+                "error": "timeout",
+                "detail": "Timed out waiting for an identical in-flight query.",
+            }
+
+    try:
+        out = execute_grok_search(query, settings)
+        if RESULT_CACHE is not None and out.get("ok"):
+            try:
+                with RESULT_CACHE_LOCK:
+                    RESULT_CACHE[key] = copy.deepcopy(out)
+            except Exception:
+                # A result that cannot be cached is still a good result
+                logger.warning("Could not cache Grok result", exc_info=True)
+    except BaseException as exc:
+        with INFLIGHT_LOCK:
+            INFLIGHT.pop(key, None)
+        future.set_exception(exc)
+        raise
+
+    # Cache is populated before the pop, and new leaders re-check it under INFLIGHT_LOCK
+    with INFLIGHT_LOCK:
+        INFLIGHT.pop(key, None)
+    future.set_result(out)
+    return out
+
+def execute_grok_search(query: str, settings: dict) -> dict:
+    if USE_SUBPROCESS:
+        return run_grok_search_subprocess(query)
+
+    try:
+        return grok_search.search(query, settings)
+    except grok_search.GrokSearchCliError as exc:
+        return exc.payload
+    except Exception as exc:
+        return {"ok": False, "error": "unexpected_exception", "detail": str(exc)}
+
+def run_grok_search_subprocess(query: str) -> dict:
     env = os.environ.copy()
     env.setdefault("PYTHONUTF8", "1")
     env.setdefault("PYTHONIOENCODING", "utf-8")
@@ -49,11 +226,8 @@ def run_grok_search(query: str) -> dict:
         proc = subprocess.run(
             cmd,
             capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
             env=env,
-            timeout=120,
+            timeout=SEARCH_TIMEOUT_SECONDS,
         )
     except subprocess.TimeoutExpired as exc:
         return {"ok": False, "error": "timeout", "detail": str(exc)}
@@ -67,17 +241,18 @@ def run_grok_search(query: str) -> dict:
     except Exception as exc:
         return {"ok": False, "error": "subprocess_error", "detail": str(exc)}
 
-    stdout = (proc.stdout or "").strip()
-    stderr = (proc.stderr or "").strip()
+    # Pipes stay binary: orjson parses the UTF-8 bytes directly, stdout is only decoded on error
+    stdout = (proc.stdout or b"").strip()
+    stderr = (proc.stderr or b"").decode("utf-8", errors="replace").strip()
 
     if stdout:
         try:
-            return json.loads(stdout)
-        except json.JSONDecodeError:
+            return orjson.loads(stdout)
+        except orjson.JSONDecodeError:
             return {
                 "ok": False,
                 "error": "non_json_output",
-                "raw_stdout": stdout,
+                "raw_stdout": stdout.decode("utf-8", errors="replace"),
                 "raw_stderr": stderr,
                 "returncode": proc.returncode,
             }
@@ -89,63 +264,58 @@ def run_grok_search(query: str) -> dict:
         "raw_stderr": stderr,
     }
 
-def handle_rpc(msg: dict):
-    # Notification: no id => no response
-    _id = msg.get("id", None)
-    method = msg.get("method", "")
-    params = msg.get("params") or {}
+def handle_message(msg: dict):
+    try:
+        rpc = msgspec.convert(msg, RpcMessage)
+    except msgspec.ValidationError:
+        return jsonrpc_error(msg.get("id"), -32600, "Invalid Request", data=msg)
+    return handle_rpc(rpc)
 
-    # Basic validation
-    if msg.get("jsonrpc") != "2.0" or not isinstance(method, str) or not method:
-        return jsonrpc_error(_id, -32600, "Invalid Request", data=msg)
+def handle_rpc(msg: RpcMessage):
+    # Notification: no id => no response
+    _id = msg.id
+    method = msg.method
+    params = msg.params or {}
 
     # ---- MCP methods ----
     if method == "initialize":
         # echo back protocolVersion when provided
-        protocol_version = params.get("protocolVersion") or "2024-11-05"
-        result = {
-            "protocolVersion": protocol_version,
-            "serverInfo": SERVER_INFO,
-            "capabilities": {
-                "tools": {},   # declare tools capability
-            },
-        }
-        return jsonrpc_result(_id, result)
+        protocol_version = params.get("protocolVersion") or DEFAULT_PROTOCOL_VERSION
+        try:
+            protocol_version_json = orjson.dumps(protocol_version)
+        except TypeError:
+            return jsonrpc_error(_id, -32602, "Invalid params: protocolVersion cannot be encoded")
+        result_json = b'{"protocolVersion":' + protocol_version_json + INITIALIZE_RESULT_TAIL_JSON
+        return jsonrpc_encoded_result(_id, result_json)
 
     if method == "tools/list":
-        return jsonrpc_result(_id, {"tools": [TOOL_DEF]})
+        return jsonrpc_encoded_result(_id, TOOLS_LIST_RESULT_JSON)
 
     if method == "tools/call":
-        name = params.get("name")
-        arguments = params.get("arguments")
+        try:
+            call = msgspec.convert(params, ToolsCallParams)
+        except msgspec.ValidationError as exc:
+            return jsonrpc_error(_id, -32602, f"Invalid params: {exc}")
 
-        if isinstance(arguments, str):
-            try:
-                arguments = json.loads(arguments)
-            except json.JSONDecodeError:
-                return jsonrpc_error(
-                    _id,
-                    -32602,
-                    "Invalid arguments: string payload is not valid JSON.",
-                    data={"arguments": arguments},
-                )
-
-        if arguments is None:
-            arguments = {}
-
-        if not isinstance(arguments, dict):
+        if call.name != TOOL_NAME:
+            return jsonrpc_error(_id, -32602, f"Unknown tool: {call.name}")
+
+        arguments = call.arguments
+        try:
+            if isinstance(arguments, str):
+                tool_args = msgspec.json.decode(arguments, type=ToolArguments)
+            else:
+                tool_args = msgspec.convert(arguments or {}, ToolArguments)
+        except msgspec.DecodeError as exc:
             return jsonrpc_error(
                 _id,
                 -32602,
-                "Invalid arguments: expected object.",
-                data={"arguments_type": type(arguments).__name__},
+                f"Invalid arguments: {exc}",
+                data={"arguments": arguments},
             )
 
-        if name != TOOL_NAME:
-            return jsonrpc_error(_id, -32602, f"Unknown tool: {name}")
-
-        query = arguments.get("query")
-        if not isinstance(query, str) or not query.strip():
+        query = tool_args.query
+        if not query.strip():
             return jsonrpc_error(_id, -32602, "Missing required argument: query")
 
         out = run_grok_search(query.strip())
@@ -157,7 +327,9 @@ def handle_rpc(msg: dict):
                 "content": [
                     {
                         "type": "text",
-                        "text": json.dumps(out, ensure_ascii=False, indent=2),
+                        "text": orjson.dumps(
+                            out, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                        ).decode(),
                     }
                 ],
                 "isError": (not bool(out.get("ok", True))),
@@ -171,6 +343,14 @@ def handle_rpc(msg: dict):
     # Unknown method
     return jsonrpc_error(_id, -32601, f"Method not found: {method}")
 
+def handle_batch_item(msg: dict):
+    # Runs on BATCH_POOL threads, which have no Flask context of their own
+    with app.app_context():
+        resp = handle_message(msg)
+        if isinstance(resp, tuple):
+            return None
+        return resp.get_json()
+
 @app.route("/", methods=["GET"])
 def health():
     return jsonify({"ok": True, "server": SERVER_INFO})
@@ -180,32 +360,66 @@ def health():
 @app.route("/mcp", methods=["POST"])
 @app.route("/mcp/", methods=["POST"])
 def rpc_entry():
-    payload = request.get_json(silent=True)
-    print("RPC payload:", payload, flush=True)
+    # Like get_json(): only JSON bodies are accepted, so cross-origin "simple requests"
+    # (e.g. text/plain, which skip CORS preflight) cannot reach tools/call
+    if not request.is_json:
+        return jsonrpc_error(None, -32600, "Invalid Request")
+
+    body = request.get_data(cache=False)
+    try:
+        # Fast path: a single well-formed message is decoded and validated in one pass
+        payload = msgspec.json.decode(body, type=RpcPayload)
+    except msgspec.ValidationError:
+        # Re-decode untyped so the error response can echo the offending message
+        payload = msgspec.json.decode(body)
+    except msgspec.DecodeError:
+        payload = None
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("RPC payload: %r", payload)
 
     if isinstance(payload, list):
-        responses = []
-        for msg in payload:
-            if isinstance(msg, dict):
-                resp = handle_rpc(msg)
-                if isinstance(resp, tuple):
-                    continue
-                responses.append(resp.get_json())
+        messages = [msg for msg in payload if isinstance(msg, dict)]
+        if len(messages) > 1:
+            results = BATCH_POOL.map(handle_batch_item, messages)
+        else:
+            results = map(handle_batch_item, messages)
+        responses = [resp for resp in results if resp is not None]
         resp_payload = jsonify(responses)
-        print("RPC response:", responses, flush=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RPC response: %r", responses)
         return resp_payload
 
-    if not isinstance(payload, dict):
+    if not isinstance(payload, (RpcMessage, dict)):
         resp = jsonrpc_error(None, -32600, "Invalid Request", data=payload)
-        print("RPC response:", resp.get_json(), flush=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RPC response: %r", resp.get_json())
         return resp
 
-    resp = handle_rpc(payload)
+    if isinstance(payload, RpcMessage):
+        resp = handle_rpc(payload)
+    else:
+        resp = handle_message(payload)
     if isinstance(resp, tuple):
-        print("RPC response: tuple", resp, flush=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RPC response: tuple %r", resp)
         return resp
-    print("RPC response:", resp.get_json(), flush=True)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("RPC response: %r", resp.get_json())
     return resp
 
+def warm_up():
+    # Prime settings and the upstream connection at boot so the first requests skip that cost
+    if USE_SUBPROCESS:
+        return
+    try:
+        settings = grok_search.get_settings(DEFAULT_ARGS)
+    except grok_search.GrokSearchCliError:
+        return
+    grok_search.warm_up(settings)
+
+if os.getenv("GROK_WARMUP", "1") != "0":
+    warm_up()
+
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5678, debug=True)
+    # Development only; production runs under gunicorn (see Dockerfile)
+    app.run(host="127.0.0.1", port=5678)
@@ -4,22 +4,29 @@
 from __future__ import annotations
 
 import argparse
+import codecs
 import json
 import os
 import sys
 import io
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Mapping, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Union
 
 try:
-    import requests
+    import httpx
+    import msgspec
+    import orjson
 except ImportError:  # pragma: no cover - emit JSON error for MCP consumers
     print(
         json.dumps(
             {
                 "ok": False,
                 "error": "missing_dependency",
-                "detail": "The 'requests' package is required. Install with 'pip install requests'.",
+                "detail": "The 'httpx[http2]', 'orjson' and 'msgspec' packages are required. "
+                "Install with 'pip install \"httpx[http2]\" orjson msgspec'.",
             },
             ensure_ascii=False,
         )
@@ -33,15 +40,74 @@ DEFAULT_SYSTEM_PROMPT = (
     "Run the provider's live search when available, synthesize the answer, "
     "and list the best sources in plain text. Always keep answers concise."
 )
+SETTINGS_ENV_VARS = (
+    "GROK_BASE_URL",
+    "GROK_API_KEY",
+    "GROK_MODEL",
+    "GROK_SYSTEM_PROMPT",
+    "GROK_TIMEOUT_SECONDS",
+    "GROK_EXTRA_BODY_JSON",
+    "GROK_EXTRA_HEADERS_JSON",
+    "GROK_INCLUDE_RAW",
+)
+# Where providers put citations, in lookup order: on the message first, then top level
+MESSAGE_SOURCE_KEYS = ("citations", "sources", "references")
+PAYLOAD_SOURCE_KEYS = ("sources", "citations", "references")
+ERROR_BODY_PREVIEW_BYTES = 2048
+HTTP_MAX_CONNECTIONS = 32
+HTTP_POOL_MAXSIZE = 16
+RETRY_ATTEMPTS = 2
+RETRY_BACKOFF_SECONDS = 0.2
+RETRY_STATUS_CODES = frozenset({502, 503, 504})
+
+
+def build_client() -> httpx.Client:
+    """Create a shared HTTP/2 client; concurrent queries multiplex over one pooled connection."""
+    transport = httpx.HTTPTransport(
+        http2=True,
+        retries=RETRY_ATTEMPTS,  # connection failures only; status retries are in post_completion
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_POOL_MAXSIZE,
+        ),
+    )
+    return httpx.Client(transport=transport)
+
+
+_CLIENT = build_client()
+
+
+def json_dumps(obj: Any) -> str:
+    """Serialise with orjson; like json.dumps(ensure_ascii=False), non-ASCII text is kept as-is."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+_STDIO_CONFIGURED = False
+
+
+def normalize_encoding(name: Optional[str]) -> str:
+    try:
+        return codecs.lookup(name or "").name
+    except LookupError:
+        return (name or "").lower()
 
 
 def configure_stdio() -> None:
     """Force stdout/stderr to UTF-8 so Grok responses with emoji won't crash on Windows."""
+    global _STDIO_CONFIGURED
+    if _STDIO_CONFIGURED:
+        return
+    _STDIO_CONFIGURED = True
+
     target_encoding = os.environ.get("PYTHONIOENCODING") or "utf-8"
+    # PYTHONIOENCODING may carry an ":errors" suffix; only the codec name matters here
+    target_name = normalize_encoding(target_encoding.split(":", 1)[0])
     for name in ("stdout", "stderr"):
         stream = getattr(sys, name, None)
         if stream is None:
             continue
+        if normalize_encoding(getattr(stream, "encoding", None)) == target_name:
+            continue
         try:
             stream.reconfigure(encoding=target_encoding)  # type: ignore[attr-defined]
             continue
@@ -87,23 +153,78 @@ def parse_args() -> argparse.Namespace:
         dest="system_prompt",
         help="Custom system prompt. Defaults to an evidence-focused instruction.",
     )
+    parser.add_argument(
+        "--include-raw",
+        dest="include_raw",
+        action="store_true",
+        help="Include the full upstream response under 'raw' in the output.",
+    )
     return parser.parse_args()
 
 
+def default_args() -> argparse.Namespace:
+    """Return the CLI defaults, for callers that import this module instead of running it."""
+    return argparse.Namespace(
+        query=None,
+        config=str(DEFAULT_CONFIG_PATH),
+        base_url=None,
+        api_key=None,
+        model=None,
+        timeout=None,
+        extra_body_json=None,
+        extra_headers_json=None,
+        system_prompt=None,
+        include_raw=False,
+    )
+
+
 def execute() -> Dict[str, Any]:
     args = parse_args()
-    settings = resolve_settings(args)
-    response = call_grok(
-        query=args.query,
-        base_url=settings["base_url"],
-        api_key=settings["api_key"],
+    settings = get_settings(args)
+    return search(args.query, settings)
+
+
+def search(query: str, settings: Mapping[str, Any]) -> Dict[str, Any]:
+    return call_grok(
+        query=query,
+        endpoint=settings["endpoint"],
+        headers=settings["base_headers"],
         model=settings["model"],
         timeout=settings["timeout_seconds"],
         system_prompt=settings["system_prompt"],
         extra_body=settings["extra_body"],
-        extra_headers=settings["extra_headers"],
+        include_raw=settings["include_raw"],
+    )
+
+
+_SETTINGS_CACHE: Dict[Any, Dict[str, Any]] = {}
+
+
+def get_settings(args: argparse.Namespace) -> Dict[str, Any]:
+    """Return resolve_settings(args), reused until config files, env vars or overrides change.
+
+    The returned dict is shared between callers and must be treated as read-only.
+    """
+    config_path = Path(args.config).expanduser()
+    key = (
+        tuple(sorted((k, v) for k, v in vars(args).items() if k != "query")),
+        file_mtime_ns(config_path),
+        file_mtime_ns(config_path.with_name("config.local.json")),
+        tuple(os.getenv(name) for name in SETTINGS_ENV_VARS),
     )
-    return response
+    settings = _SETTINGS_CACHE.get(key)
+    if settings is None:
+        settings = resolve_settings(args)
+        _SETTINGS_CACHE.clear()
+        _SETTINGS_CACHE[key] = settings
+    return settings
+
+
+def file_mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return 0
 
 
 def resolve_settings(args: argparse.Namespace) -> Dict[str, Any]:
@@ -139,6 +260,9 @@ def resolve_settings(args: argparse.Namespace) -> Dict[str, Any]:
                 }
             ) from exc
 
+    if os.getenv("GROK_INCLUDE_RAW"):
+        config["include_raw"] = os.getenv("GROK_INCLUDE_RAW") == "1"
+
     if os.getenv("GROK_EXTRA_BODY_JSON"):
         config["extra_body"] = merge_mappings(
             config.get("extra_body"),
@@ -162,6 +286,8 @@ def resolve_settings(args: argparse.Namespace) -> Dict[str, Any]:
         config["timeout_seconds"] = args.timeout
     if args.system_prompt:
         config["system_prompt"] = args.system_prompt
+    if args.include_raw:
+        config["include_raw"] = True
     if args.extra_body_json:
         config["extra_body"] = merge_mappings(
             config.get("extra_body"),
@@ -180,6 +306,7 @@ def resolve_settings(args: argparse.Namespace) -> Dict[str, Any]:
     system_prompt = config.get("system_prompt") or DEFAULT_SYSTEM_PROMPT
     extra_body = config.get("extra_body") or {}
     extra_headers = config.get("extra_headers") or {}
+    include_raw = bool(config.get("include_raw"))
 
     if not base_url:
         raise GrokSearchCliError(
@@ -198,36 +325,53 @@ def resolve_settings(args: argparse.Namespace) -> Dict[str, Any]:
         "system_prompt": system_prompt,
         "extra_body": extra_body,
         "extra_headers": extra_headers,
+        "include_raw": include_raw,
+        # Precomputed once so call_grok does no URL or header assembly per query
+        "endpoint": build_endpoint(base_url),
+        "base_headers": MappingProxyType(
+            {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+                **{k: str(v) for k, v in extra_headers.items()},
+            }
+        ),
     }
 
 
 def load_json_file(path: Path) -> Dict[str, Any]:
     if not path.exists():
         return {}
+    # Copy so callers can update() the result without touching the cached object
+    return dict(read_json_object(str(path), file_mtime_ns(path)))
+
+
+@lru_cache(maxsize=8)
+def read_json_object(path_str: str, mtime_ns: int) -> Dict[str, Any]:
+    """Parse a JSON config object; cached per (path, mtime) so unchanged files are read once."""
+    path = Path(path_str)
     try:
-        with path.open("r", encoding="utf-8") as fh:
-            data = json.load(fh)
-            if not isinstance(data, dict):
-                raise GrokSearchCliError(
-                    {
-                        "ok": False,
-                        "error": "invalid_config_shape",
-                        "detail": f"Config file {path} must contain a JSON object.",
-                    }
-                )
-            return data
-    except json.JSONDecodeError as exc:
+        data = orjson.loads(path.read_bytes())
+    except orjson.JSONDecodeError as exc:
         raise GrokSearchCliError(
             {"ok": False, "error": "config_parse_error", "detail": f"{path}: {exc}"}
         ) from exc
+    if not isinstance(data, dict):
+        raise GrokSearchCliError(
+            {
+                "ok": False,
+                "error": "invalid_config_shape",
+                "detail": f"Config file {path} must contain a JSON object.",
+            }
+        )
+    return data
 
 
 def parse_json_mapping(raw: Optional[str], source: str) -> Dict[str, Any]:
     if not raw:
         return {}
     try:
-        data = json.loads(raw)
-    except json.JSONDecodeError as exc:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError as exc:
         raise GrokSearchCliError(
             {"ok": False, "error": "invalid_json", "detail": f"{source} is not valid JSON: {exc}"}
         ) from exc
@@ -257,13 +401,13 @@ def build_endpoint(base_url: str) -> str:
 def call_grok(
     *,
     query: str,
-    base_url: str,
-    api_key: str,
+    endpoint: str,
+    headers: Mapping[str, str],
     model: str,
     timeout: float,
     system_prompt: str,
     extra_body: Mapping[str, Any],
-    extra_headers: Mapping[str, str],
+    include_raw: bool = False,
 ) -> Dict[str, Any]:
     payload: Dict[str, Any] = {
         "model": model,
@@ -272,27 +416,60 @@ def call_grok(
             {"role": "user", "content": query},
         ],
         "temperature": 0,
-        "stream": False,
+        "stream": True,
     }
     payload.update(extra_body or {})
 
-    headers: Dict[str, str] = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
+    try:
+        payload_json = post_completion(endpoint, headers, orjson.dumps(payload), timeout)
+    except httpx.TimeoutException as exc:
+        raise GrokSearchCliError({"ok": False, "error": "timeout", "detail": str(exc)}) from exc
+    except (httpx.HTTPError, httpx.InvalidURL) as exc:
+        raise GrokSearchCliError({"ok": False, "error": "network_error", "detail": str(exc)}) from exc
+
+    content = extract_message_text(payload_json)
+    sources = extract_sources(payload_json)
+
+    result: Dict[str, Any] = {
+        "ok": True,
+        "content": content,
+        "sources": sources,
     }
-    headers.update({k: str(v) for k, v in (extra_headers or {}).items()})
+    # The full upstream payload usually dwarfs content + sources, so it is opt-in
+    if include_raw:
+        result["raw"] = payload_json
+    return result
 
-    endpoint = build_endpoint(base_url)
 
+def post_completion(
+    endpoint: str, headers: Mapping[str, str], body: bytes, timeout: float
+) -> Dict[str, Any]:
+    attempt = 0
+    while True:
+        with _CLIENT.stream(
+            "POST", endpoint, headers=headers, content=body, timeout=timeout
+        ) as response:
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= RETRY_ATTEMPTS:
+                return read_completion(response)
+        time.sleep(RETRY_BACKOFF_SECONDS * (2**attempt))
+        attempt += 1
+
+
+def warm_up(settings: Mapping[str, Any], timeout: float = 2.0) -> None:
+    """Open a pooled connection (TCP + TLS) to the upstream before the first real query."""
     try:
-        response = requests.post(endpoint, headers=headers, json=payload, timeout=timeout)
-    except requests.Timeout as exc:
-        raise GrokSearchCliError({"ok": False, "error": "timeout", "detail": str(exc)}) from exc
-    except requests.RequestException as exc:
-        raise GrokSearchCliError({"ok": False, "error": "network_error", "detail": str(exc)}) from exc
+        # Any status will do; only the kept-alive connection matters
+        _CLIENT.head(settings["endpoint"], timeout=timeout)
+    except (httpx.HTTPError, httpx.InvalidURL):
+        pass
+
 
+def read_completion(response: httpx.Response) -> Dict[str, Any]:
+    """Return the completion as a chat.completion dict, whether or not the upstream streamed it."""
     if response.status_code >= 400:
-        detail = safe_truncate(response.text.strip(), 400)
+        # Only the head of the body is read; upstream error pages can be arbitrarily large
+        head = next(response.iter_bytes(ERROR_BODY_PREVIEW_BYTES), b"")
+        detail = safe_truncate(head.strip(), 400)
         raise GrokSearchCliError(
             {
                 "ok": False,
@@ -302,70 +479,170 @@ def call_grok(
             }
         )
 
+    # Upstreams that ignore "stream": true (or extra_body overriding it) reply with plain JSON
+    if "text/event-stream" in response.headers.get("Content-Type", ""):
+        return collect_stream(response)
+
+    body = response.read()
     try:
-        payload_json = response.json()
+        return orjson.loads(body)
     except ValueError as exc:
         raise GrokSearchCliError(
             {
                 "ok": False,
                 "error": "invalid_json_response",
-                "detail": safe_truncate(response.text, 400),
+                "detail": safe_truncate(body, 400),
             }
         ) from exc
 
-    content = extract_message_text(payload_json)
-    sources = extract_sources(payload_json)
 
-    return {
-        "ok": True,
-        "content": content,
-        "sources": sources,
-        "raw": payload_json,
-    }
+def collect_stream(response: httpx.Response) -> Dict[str, Any]:
+    """Fold SSE chat.completion.chunk events into the shape of a non-streaming response."""
+    merged: Dict[str, Any] = {}
+    message: Dict[str, Any] = {"role": "assistant"}
+    text_parts: Dict[str, List[str]] = {"content": []}
+    finish_reason = None
+
+    for line in response.iter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = orjson.loads(data)
+        except orjson.JSONDecodeError as exc:
+            raise GrokSearchCliError(
+                {
+                    "ok": False,
+                    "error": "invalid_json_response",
+                    "detail": safe_truncate(data, 400),
+                }
+            ) from exc
+        if not isinstance(chunk, dict):
+            continue
+        if chunk.get("error"):
+            raise GrokSearchCliError(
+                {"ok": False, "error": "stream_error", "detail": chunk["error"]}
+            )
 
+        choices = chunk.pop("choices", None)
+        # Top-level fields (id, model, usage, citations, ...) keep their latest value
+        merged.update(chunk)
+        if not (isinstance(choices, list) and choices and isinstance(choices[0], Mapping)):
+            continue
+        choice = choices[0]
+        delta = choice.get("delta")
+        if isinstance(delta, Mapping):
+            for key, value in delta.items():
+                if isinstance(value, str) and key != "role":
+                    text_parts.setdefault(key, []).append(value)
+                elif value is not None:
+                    message[key] = value
+        if choice.get("finish_reason"):
+            finish_reason = choice["finish_reason"]
+
+    for key, parts in text_parts.items():
+        message[key] = "".join(parts)
+    merged["choices"] = [{"index": 0, "message": message, "finish_reason": finish_reason}]
+    return merged
 
-def extract_message_text(payload_json: Mapping[str, Any]) -> str:
+
+def first_message(payload_json: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
     choices = payload_json.get("choices")
-    if isinstance(choices, list) and choices:
-        message = choices[0].get("message", {})
-        if isinstance(message, Mapping):
-            content = message.get("content")
-            if isinstance(content, str):
-                return content.strip()
-            if isinstance(content, list):
-                parts: List[str] = []
-                for part in content:
-                    if isinstance(part, Mapping):
-                        if part.get("type") == "text" and isinstance(part.get("text"), str):
-                            parts.append(part["text"])
-                return "\n".join(p.strip() for p in parts if p)
-    return json.dumps(payload_json, ensure_ascii=False)
+    if not isinstance(choices, list) or not choices:
+        return None
+    choice = choices[0]
+    if not isinstance(choice, Mapping):
+        return None
+    message = choice.get("message")
+    return message if isinstance(message, Mapping) else None
+
+
+def extract_message_text(payload_json: Mapping[str, Any]) -> str:
+    message = first_message(payload_json)
+    if message is not None:
+        content = message.get("content")
+        if isinstance(content, str):
+            return content.strip()
+        if isinstance(content, list):
+            parts: List[str] = []
+            for part in content:
+                if isinstance(part, Mapping) and part.get("type") == "text":
+                    text = part.get("text")
+                    if isinstance(text, str) and text:
+                        parts.append(text.strip())
+            return "\n".join(parts)
+    return json_dumps(payload_json)
 
 
 def extract_sources(payload_json: Mapping[str, Any]) -> List[Dict[str, Any]]:
-    potential_sources: Iterable[Any] = ()
-    choices = payload_json.get("choices")
-    if isinstance(choices, list) and choices:
-        message = choices[0].get("message", {})
-        if isinstance(message, Mapping):
-            for key in ("citations", "sources", "references"):
-                value = message.get(key) or message.get("metadata", {}).get(key)
-                if value:
-                    potential_sources = value  # type: ignore[assignment]
-                    break
+    potential_sources: Any = None
+    message = first_message(payload_json)
+    if message is not None:
+        metadata = message.get("metadata")
+        if not isinstance(metadata, Mapping):
+            metadata = None
+        for key in MESSAGE_SOURCE_KEYS:
+            potential_sources = message.get(key) or (metadata.get(key) if metadata else None)
+            if potential_sources:
+                break
     if not potential_sources:
-        for key in ("sources", "citations", "references"):
-            value = payload_json.get(key)
-            if value:
-                potential_sources = value  # type: ignore[assignment]
+        for key in PAYLOAD_SOURCE_KEYS:
+            potential_sources = payload_json.get(key)
+            if potential_sources:
                 break
 
+    if not isinstance(potential_sources, list):
+        return []
+    return normalize_sources(potential_sources)
+
+
+class RawSource(msgspec.Struct):
+    """A citation object as providers send it; each field has a primary and a fallback key."""
+
+    url: Any = None
+    href: Any = None
+    title: Any = None
+    name: Any = None
+    snippet: Any = None
+    quote: Any = None
+
+
+_SOURCE_LIST_TYPE = List[Union[str, RawSource]]
+
+
+def normalize_sources(items: List[Any]) -> List[Dict[str, Any]]:
+    try:
+        # One native pass over the whole list when every entry is a URL string or an object
+        entries = msgspec.convert(items, _SOURCE_LIST_TYPE)
+    except msgspec.ValidationError:
+        entries = None
+
     normalized: List[Dict[str, Any]] = []
-    if isinstance(potential_sources, list):
-        for item in potential_sources:
+    if entries is None:
+        for item in items:
             normalized_item = normalize_source_entry(item)
             if normalized_item:
                 normalized.append(normalized_item)
+        return normalized
+
+    for entry in entries:
+        if isinstance(entry, str):
+            normalized.append({"url": entry})
+            continue
+        normalized_item: Dict[str, Any] = {}
+        url = entry.url or entry.href
+        if url:
+            normalized_item["url"] = url
+        title = entry.title or entry.name
+        if title:
+            normalized_item["title"] = title
+        snippet = entry.snippet or entry.quote
+        if snippet:
+            normalized_item["snippet"] = snippet
+        if normalized_item:
+            normalized.append(normalized_item)
     return normalized
 
 
@@ -387,9 +664,12 @@ def normalize_source_entry(entry: Any) -> Optional[Dict[str, Any]]:
     return None
 
 
-def safe_truncate(value: Optional[str], limit: int) -> str:
+def safe_truncate(value: Union[bytes, str, None], limit: int) -> str:
     if not value:
         return ""
+    if isinstance(value, bytes):
+        # Slice before decoding: limit characters never need more than 4 UTF-8 bytes each
+        value = value[: limit * 4].decode("utf-8", errors="replace")
     return value if len(value) <= limit else value[: limit - 3] + "..."
 
 
@@ -397,18 +677,15 @@ def main() -> int:
     try:
         payload = execute()
     except GrokSearchCliError as exc:
-        print(json.dumps(exc.payload, ensure_ascii=False))
+        print(json_dumps(exc.payload))
         return exc.exit_code
     except Exception as exc:  # pragma: no cover - ensure JSON output for unexpected errors
         print(
-            json.dumps(
-                {"ok": False, "error": "unexpected_exception", "detail": str(exc)},
-                ensure_ascii=False,
-            )
+            json_dumps({"ok": False, "error": "unexpected_exception", "detail": str(exc)})
         )
         return 1
 
-    print(json.dumps(payload, ensure_ascii=False))
+    print(json_dumps(payload))
     return 0
 
 